@@ -0,0 +1,112 @@
+"""GitHub access, environment checks and helpers shared by the review and fix scripts"""
+import functools
+import itertools
+import json
+import os
+import sys
+
+import llm_cache
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Use Gemini 2.5 Flash for better free tier limits (10 RPM vs 5 RPM for Pro)
+DEFAULT_MODEL = 'gemini-2.5-flash'
+
+# Shared session so GitHub API calls reuse pooled keep-alive connections.
+# Only api.github.com is contacted, and never by more than a handful of threads
+SESSION = requests.Session()
+SESSION.headers.update({'Accept': 'application/vnd.github.v3+json'})
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+))
+
+# Repo info and GitHub auth are fixed for the life of the process, so resolve them once
+REPO = os.environ.get('GITHUB_REPOSITORY', 'jehanzaib084/nextjs-payload-pipeline-v1')
+# One or more tokens; GITHUB_TOKENS (comma-separated) spreads requests across
+# several tokens' rate limits, otherwise the single GITHUB_TOKEN is used
+GITHUB_TOKENS = [t.strip() for t in (os.environ.get('GITHUB_TOKENS') or os.environ.get('GITHUB_TOKEN', '')).split(',')
+                 if t.strip()]
+_TOKEN_CYCLE = itertools.cycle(GITHUB_TOKENS or [''])
+OWNER, _, REPO_NAME = REPO.partition('/')
+API_BASE = f"https://api.github.com/repos/{OWNER}/{REPO_NAME}"
+
+GRAPHQL_URL = 'https://api.github.com/graphql'
+PR_FILES_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      files(first: 100) { nodes { path additions deletions } }
+    }
+  }
+}
+"""
+
+def validate_environment(api_key):
+    """Exit with an error if the Gemini key, GitHub token or repository is missing"""
+    if not api_key or api_key == "":
+        print("Error: GEMINI_API_KEY is required")
+        sys.exit(1)
+
+    if not GITHUB_TOKENS:
+        print("Error: GITHUB_TOKEN or GITHUB_TOKENS is required")
+        sys.exit(1)
+
+    if not OWNER or not REPO_NAME or '/' in REPO_NAME:
+        print(f"Error: Invalid repository format: {REPO}")
+        sys.exit(1)
+
+@functools.lru_cache(maxsize=None)
+def get_model(api_key, model_name=DEFAULT_MODEL):
+    """Configure Gemini and build the model on first use. Raises on configuration errors"""
+    # Imported here so runs answered entirely from the response cache (or that
+    # exit early) never pay for the heavy grpc/protobuf import
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name, generation_config=llm_cache.GENERATION_CONFIG)
+
+def github_headers():
+    """REST headers, rotating through the configured GitHub tokens per request"""
+    return {'Authorization': f'token {next(_TOKEN_CYCLE)}'}
+
+def gql(query, variables):
+    """Run a GitHub GraphQL query, returning its data or None on failure"""
+    try:
+        response = SESSION.post(GRAPHQL_URL, json={'query': query, 'variables': variables},
+                                headers={'Authorization': f'bearer {next(_TOKEN_CYCLE)}'}, timeout=30)
+        if response.status_code != 200:
+            print(f"GraphQL request failed: {response.status_code} - {response.text}")
+            return None
+        payload = response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Error running GraphQL query: {e}")
+        return None
+    except json.JSONDecodeError as e:
+        print(f"Error parsing GraphQL response: {e}")
+        return None
+
+    if payload.get('errors'):
+        print(f"GraphQL query returned errors: {payload['errors']}")
+        return None
+    return payload.get('data')
+
+def get_changed_files(pr_number):
+    """Get list of changed files in the PR with a single GraphQL round-trip"""
+    data = gql(PR_FILES_QUERY, {'owner': OWNER, 'repo': REPO_NAME, 'number': pr_number})
+    pull_request = ((data or {}).get('repository') or {}).get('pullRequest')
+    if not pull_request:
+        print(f"Failed to fetch PR #{pr_number}")
+        return []
+    return [f['path'] for f in pull_request['files']['nodes'] if f.get('path')]
+
+def read_head(f, limit):
+    """Read at most `limit` chars, trimming a truncated read back to the last full line"""
+    content = f.read(limit + 1)  # One extra char tells us whether the file was cut off
+    if len(content) > limit:
+        content = content[:limit]
+        newline = content.rfind('\n')
+        if newline > 0:
+            content = content[:newline]
+    return content
@@ -1,11 +1,48 @@
 #!/usr/bin/env python3
+import asyncio
 import os
+import re
+import shutil
 import sys
-import requests
-import json
 import subprocess
-import google.generativeai as genai
-import time
+import gemini_retry
+import llm_cache
+from concurrent.futures import ThreadPoolExecutor
+from gemini_common import DEFAULT_MODEL, get_changed_files, get_model, read_head, validate_environment
+
+# Matches each "**File: path**" header followed by its fenced code block. Prose
+# lines may sit between the header and the fence, and the fence line may carry
+# any tag. `close` is empty when the last block is never closed, in which case
+# the code runs to the end of the response
+FIX_RE = re.compile(
+    r'^\*\*File:\s*(?P<path>[^*\n]+)\*\*[^\n]*\n'
+    r'(?:(?!\*\*File:|[ \t]*```)[^\n]*\n)*?'
+    r'[ \t]*```[^\n]*\n(?P<code>.*?)(?P<close>\n```|\Z)',
+    re.MULTILINE | re.DOTALL,
+)
+
+# Fix instructions that never change between runs, sent ahead of the per-file
+# content. At ~100 tokens the prompt stays well under Gemini's 1024-token
+# minimum for context caching, so this ordering brings no cache benefit.
+STATIC_HEADER = """
+    Fix code quality issues in the file below. Focus on critical fixes only.
+
+    Fix only these issues:
+    - Syntax errors
+    - Unused variables
+    - TypeScript errors
+    - Critical formatting issues
+
+    Output format (use the exact file path given below):
+    **File: filename**
+    ```typescript
+    fixed code here
+    ```
+    
+    Provide complete, working file contents only.
+
+    File with issues:
+    """
 
 def main():
     if len(sys.argv) < 3:
@@ -13,167 +50,40 @@ def main():
         sys.exit(1)
 
     api_key = sys.argv[1]
-    pr_number = sys.argv[2]
-
-    if not api_key or api_key == "":
-        print("Error: GEMINI_API_KEY is required")
-        sys.exit(1)
-
-    # Configure Gemini
-    try:
-        genai.configure(api_key=api_key)
-        # Use Gemini 2.5 Flash for better free tier limits (10 RPM vs 5 RPM for Pro)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-    except Exception as e:
-        print(f"Error configuring Gemini: {e}")
-        sys.exit(1)
-
-    # Get repo info
-    repo = os.environ.get('GITHUB_REPOSITORY', 'jehanzaib084/nextjs-payload-pipeline-v1')
-    github_token = os.environ.get('GITHUB_TOKEN', '')
-    
-    if not github_token:
-        print("Error: GITHUB_TOKEN is required")
-        sys.exit(1)
-    
     try:
-        owner, repo_name = repo.split('/')
+        pr_number = int(sys.argv[2])
     except ValueError:
-        print(f"Error: Invalid repository format: {repo}")
+        print(f"Error: Invalid PR number: {sys.argv[2]}")
         sys.exit(1)
 
-    # Get PR diff
-    diff_url = f"https://api.github.com/repos/{owner}/{repo_name}/pulls/{pr_number}"
-    headers = {'Authorization': f'token {github_token}', 'Accept': 'application/vnd.github.v3+json'}
-    
-    try:
-        pr_response = requests.get(diff_url, headers=headers, timeout=30)
-        if pr_response.status_code != 200:
-            print(f"Failed to fetch PR: {pr_response.status_code} - {pr_response.text}")
-            return
-        pr_data = pr_response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching PR data: {e}")
-        return
-    except json.JSONDecodeError as e:
-        print(f"Error parsing PR data: {e}")
-        return
-
-    pr_data = pr_response.json()
+    validate_environment(api_key)
 
     # Get changed files list
-    files_url = f"{diff_url}/files"
-    try:
-        files_response = requests.get(files_url, headers=headers, timeout=30)
-        if files_response.status_code != 200:
-            print(f"Failed to fetch files: {files_response.status_code}")
-            changed_files = []
-        else:
-            files_data = files_response.json()
-            changed_files = [f['filename'] for f in files_data if f.get('filename')]
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching files: {e}")
-        changed_files = []
-    except json.JSONDecodeError as e:
-        print(f"Error parsing files data: {e}")
-        changed_files = []
+    changed_files = get_changed_files(pr_number)
 
     if not changed_files:
         print("No changed files found or unable to fetch files")
         return
 
     # Get changed file contents (optimized for free tier)
+    files_to_read = changed_files[:3]  # Reduced to 3 files to stay within token limits
     files_content = {}
-    for file in changed_files[:3]:  # Reduced to 3 files to stay within token limits
-        try:
-            if os.path.exists(file):
-                with open(file, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()[:2000]  # Reduced to 2k chars per file
-                    files_content[file] = content
-        except (IOError, OSError, UnicodeDecodeError) as e:
-            print(f"Warning: Could not read file {file}: {e}")
-            continue
+    with ThreadPoolExecutor(max_workers=min(8, len(files_to_read))) as executor:
+        for path, content in executor.map(_read_file, files_to_read):
+            if content:
+                files_content[path] = content
 
     if not files_content:
         print("No readable files found in the changeset")
         return
 
-    # Prepare prompt for Gemini (optimized for free tier token limits)
-    prompt = f"""
-    Fix code quality issues in these files. Focus on critical fixes only.
-
-    Files with issues:
-    """
-    for file, content in files_content.items():
-        prompt += f"\n**{file}:**\n```\n{content}\n```\n"
-
-    prompt += """
-    Fix only these issues:
-    - Syntax errors
-    - Unused variables
-    - TypeScript errors
-    - Critical formatting issues
-
-    Output format:
-    **File: filename**
-    ```typescript
-    fixed code here
-    ```
-    
-    Provide complete, working file contents only.
-    """
-
-    # Generate fixes with improved retry logic for rate limits
-    max_retries = 5  # Increase retries for rate limits
-    base_delay = 5  # Start with 5 second delay
-    
-    for attempt in range(max_retries):
-        try:
-            response = model.generate_content(prompt)
-            if response and response.text:
-                fixes = response.text
-                break
-            else:
-                print(f"Empty response from Gemini (attempt {attempt + 1})")
-                if attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt)  # Exponential backoff
-                    print(f"Waiting {delay} seconds before retry...")
-                    time.sleep(delay)
-                else:
-                    print("Failed to get valid response from Gemini")
-                    return
-        except Exception as e:
-            error_msg = str(e)
-            print(f"Error generating fixes (attempt {attempt + 1}): {error_msg}")
-            
-            # Handle rate limit errors specifically
-            if "429" in error_msg or "quota" in error_msg.lower():
-                if attempt < max_retries - 1:
-                    # Extract retry delay from error if available
-                    retry_delay = 60  # Default 60 seconds for rate limits
-                    if "retry_delay" in error_msg:
-                        try:
-                            import re
-                            delay_match = re.search(r'seconds: (\d+)', error_msg)
-                            if delay_match:
-                                retry_delay = int(delay_match.group(1)) + 5  # Add 5 sec buffer
-                        except:
-                            pass
-                    
-                    print(f"Rate limit hit. Waiting {retry_delay} seconds before retry...")
-                    time.sleep(retry_delay)
-                else:
-                    print("Rate limit exceeded. Consider using paid tier for higher limits.")
-                    return
-            else:
-                # Non-rate-limit errors: use exponential backoff
-                if attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt)
-                    print(f"Waiting {delay} seconds before retry...")
-                    time.sleep(delay)
-                else:
-                    print("Failed to generate fixes after multiple attempts")
-                    return
+    # Generate fixes with one Gemini call per file, run concurrently so the
+    # total wait is that of the slowest file rather than the sum of all of them
+    results = asyncio.run(generate_fixes(api_key, files_content))
+    fixes = "\n".join(text for text in results if text)
+    if not fixes:
+        print("Failed to generate fixes after multiple attempts")
+        return
 
     # Parse and apply fixes (improved parsing)
     if not parse_and_apply_fixes(fixes):
@@ -183,46 +93,93 @@ def main():
     # Commit fixes with proper error handling
     commit_fixes()
 
+def build_prompt(file, content):
+    """Build the fix prompt for a single file (optimized for free tier token limits)"""
+    return "".join([STATIC_HEADER, f"\n**{file}:**\n```\n{content}\n```\n"])
+
+async def generate_fixes(api_key, files_content):
+    """Request fixes for all files concurrently, returning response texts in order"""
+    return await asyncio.gather(*(fix_one(api_key, file, content) for file, content in files_content.items()))
+
+async def collect_fix(response):
+    """Collect a streamed response, stopping as soon as the fixed file's code block
+    closes so we don't wait for any trailing explanation"""
+    parts = []
+    async for chunk in response:
+        try:
+            parts.append(chunk.text)
+        except ValueError:
+            continue  # Chunks without text parts (e.g. only a finish reason)
+        match = FIX_RE.search("".join(parts))
+        if match and match['close']:  # Empty until the closing fence line arrives
+            break
+    return "".join(parts)
+
+async def fix_one(api_key, file, content):
+    """Generate a fix for one file with retry logic for rate limits. Returns None on failure"""
+    prompt = build_prompt(file, content)
+
+    # Skip the Gemini call entirely if this exact prompt was answered recently
+    cache_key = llm_cache.cache_key(DEFAULT_MODEL, prompt)
+    cached = llm_cache.get_cached_response(cache_key)
+    if cached:
+        print(f"Using cached fix for {file}")
+        return cached
+
+    try:
+        model = get_model(api_key)
+    except Exception as e:
+        print(f"Error configuring Gemini: {e}")
+        return None
+
+    for attempt in range(gemini_retry.MAX_ATTEMPTS):
+        try:
+            response = await model.generate_content_async(prompt, stream=True)
+            text = await collect_fix(response)
+            if text:
+                llm_cache.cache_response(cache_key, text)
+                return text
+            print(f"Empty response from Gemini for {file} (attempt {attempt + 1})")
+            delay = gemini_retry.backoff_delay(attempt)
+        except Exception as e:
+            print(f"Error generating fixes for {file} (attempt {attempt + 1}): {e}")
+            delay = gemini_retry.retry_delay(e, attempt)
+            if delay is None:
+                print(f"Error is not retryable, giving up on {file}")
+                return None
+            if gemini_retry.is_rate_limited(e):
+                print("Rate limit hit.")
+
+        if attempt < gemini_retry.MAX_ATTEMPTS - 1:
+            print(f"Waiting {delay:.0f} seconds before retry...")
+            await asyncio.sleep(delay)
+
+    print(f"Failed to generate fixes for {file} after multiple attempts")
+    return None
+
+def _read_file(path):
+    """Read the head of a changed file, returning (path, content or None)"""
+    try:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            return path, read_head(f, 2000)  # Reduced to 2k chars per file
+    except FileNotFoundError:
+        pass  # Deleted in the PR; nothing to fix
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        print(f"Warning: Could not read file {path}: {e}")
+    return path, None
+
 def parse_and_apply_fixes(fixes):
     """Parse AI response and apply fixes to files"""
-    lines = fixes.split('\n')
-    current_file = None
-    code_lines = []
-    in_code_block = False
-    fixes_applied = 0
-    
-    for line in lines:
-        if line.startswith('**File: ') and '**' in line[8:]:
-            # Save previous file if exists
-            if current_file and code_lines:
-                if apply_fix(current_file, '\n'.join(code_lines)):
-                    fixes_applied += 1
-            
-            # Extract filename
-            try:
-                current_file = line.split('**File: ')[1].split('**')[0].strip()
-                code_lines = []
-                in_code_block = False
-            except IndexError:
-                print(f"Warning: Could not parse filename from: {line}")
-                current_file = None
-                
-        elif line.startswith('```') and current_file:
-            in_code_block = not in_code_block
-            if not in_code_block and code_lines:
-                # End of code block - apply fix
-                if apply_fix(current_file, '\n'.join(code_lines)):
-                    fixes_applied += 1
-                code_lines = []
-                current_file = None
-                
-        elif in_code_block and current_file:
-            code_lines.append(line)
-    
-    # Handle last file if no closing ```
-    if current_file and code_lines:
-        if apply_fix(current_file, '\n'.join(code_lines)):
-            fixes_applied += 1
+    # Later blocks for the same file win, as they would when applied in order
+    fixes_by_path = {match['path'].strip(): match['code'] for match in FIX_RE.finditer(fixes)}
+    if not fixes_by_path:
+        print("Applied fixes to 0 files")
+        return False
+
+    # Each fix touches a different file, so backups and writes can overlap
+    with ThreadPoolExecutor(max_workers=min(8, len(fixes_by_path))) as executor:
+        results = list(executor.map(lambda item: apply_fix(*item), fixes_by_path.items()))
+    fixes_applied = sum(results)
     
     print(f"Applied fixes to {fixes_applied} files")
     return fixes_applied > 0
@@ -243,10 +200,8 @@ def apply_fix(file_path, fixed_code):
         # Backup original file
         backup_path = f"{file_path}.backup"
         try:
-            with open(file_path, 'r', encoding='utf-8') as original:
-                with open(backup_path, 'w', encoding='utf-8') as backup:
-                    backup.write(original.read())
-        except Exception as e:
+            shutil.copyfile(file_path, backup_path)
+        except OSError as e:
             print(f"Warning: Could not create backup for {file_path}: {e}")
         
         # Apply fix
@@ -262,37 +217,26 @@ def apply_fix(file_path, fixed_code):
         backup_path = f"{file_path}.backup"
         if os.path.exists(backup_path):
             try:
-                with open(backup_path, 'r', encoding='utf-8') as backup:
-                    with open(file_path, 'w', encoding='utf-8') as original:
-                        original.write(backup.read())
+                shutil.copyfile(backup_path, file_path)
                 print(f"Restored backup for {file_path}")
-            except Exception as restore_e:
+            except OSError as restore_e:
                 print(f"Failed to restore backup for {file_path}: {restore_e}")
         return False
 
 def commit_fixes():
     """Commit and push fixes with proper error handling"""
     try:
-        # Check if there are any changes
-        result = subprocess.run(['git', 'status', '--porcelain'], 
+        # Check if there are any changes to tracked files (backups are untracked)
+        result = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], 
                               capture_output=True, text=True, cwd='.', timeout=30)
         if not result.stdout.strip():
             print("No changes to commit")
             return
             
-        # Configure git user if not set
-        try:
-            subprocess.run(['git', 'config', 'user.email', 'github-actions@github.com'], 
-                         check=True, cwd='.', timeout=10)
-            subprocess.run(['git', 'config', 'user.name', 'GitHub Actions'], 
-                         check=True, cwd='.', timeout=10)
-        except subprocess.CalledProcessError:
-            pass  # User might already be configured
-            
-        # Add, commit and push
-        subprocess.run(['git', 'add', '.'], check=True, cwd='.', timeout=30)
-        
-        commit_result = subprocess.run(['git', 'commit', '-m', 'chore: auto-fix code quality issues'], 
+        # Set the commit identity, stage modified files and commit in one git process
+        commit_result = subprocess.run(['git', '-c', 'user.email=github-actions@github.com',
+                                        '-c', 'user.name=GitHub Actions',
+                                        'commit', '-am', 'chore: auto-fix code quality issues'], 
                                      cwd='.', timeout=30, capture_output=True, text=True)
         if commit_result.returncode != 0:
             print(f"Commit failed: {commit_result.stderr}")
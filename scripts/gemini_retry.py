@@ -0,0 +1,62 @@
+"""Retry policy for Gemini calls, shared by the review and fix scripts"""
+import random
+import re
+
+MAX_ATTEMPTS = 5
+
+# Backoff schedules, one delay per attempt (doubling, capped). Rate limits
+# (429 / quota) need long waits; transient server errors short ones
+RATE_LIMIT_BACKOFFS = (15, 30, 60, 120, 120)
+TRANSIENT_BACKOFFS = (2, 4, 8, 16, 30)
+
+# Fallback for errors that only carry the RetryInfo delay in their message
+_RETRY_DELAY_RE = re.compile(r'seconds:\s*(\d+)')
+
+def _jittered(backoffs, attempt):
+    """Scheduled backoff with jitter, so parallel jobs don't retry in lockstep"""
+    delay = backoffs[attempt] if attempt < len(backoffs) else backoffs[-1]
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def _server_retry_delay(error):
+    """Extract the server-suggested retry delay (google.rpc.RetryInfo), if any"""
+    for detail in getattr(error, 'details', None) or []:
+        retry_delay = getattr(detail, 'retry_delay', None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+        if isinstance(detail, dict) and detail.get('retryDelay'):
+            try:
+                return float(str(detail['retryDelay']).rstrip('s'))
+            except ValueError:
+                pass
+    match = _RETRY_DELAY_RE.search(str(error))
+    return int(match.group(1)) if match else None
+
+def backoff_delay(attempt):
+    """Delay before retrying a transient failure such as an empty response"""
+    return _jittered(TRANSIENT_BACKOFFS, attempt)
+
+def is_rate_limited(error):
+    """Whether the error is a Gemini rate limit / quota error"""
+    from google.api_core import exceptions
+    # TooManyRequests (HTTP 429) is the parent of gRPC's ResourceExhausted
+    return isinstance(error, exceptions.TooManyRequests)
+
+def retry_delay(error, attempt):
+    """Seconds to wait before retrying after `error`, or None if it isn't retryable"""
+    # Imported here: by the time a call has failed the SDK is already loaded
+    from google.api_core import exceptions
+
+    if isinstance(error, exceptions.TooManyRequests):
+        server_delay = _server_retry_delay(error)
+        if server_delay is not None:
+            return server_delay + random.uniform(1, 5)  # Small buffer past the reset
+        return _jittered(RATE_LIMIT_BACKOFFS, attempt)
+
+    if isinstance(error, exceptions.ServerError):
+        return backoff_delay(attempt)  # 5xx, deadlines, unknown errors
+
+    if isinstance(error, exceptions.ClientError):
+        return None  # Invalid requests, auth failures etc. won't succeed on retry
+
+    # Anything else (connection resets, malformed responses) is treated as transient
+    return backoff_delay(attempt)
@@ -1,200 +1,300 @@
 #!/usr/bin/env python3
+import argparse
+import functools
+import hashlib
+import io
 import os
-import sys
+import re
 import requests
 import json
 import subprocess
-import google.generativeai as genai
+import gemini_retry
+import llm_cache
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import Pool
+from gemini_common import (API_BASE, DEFAULT_MODEL, SESSION, get_changed_files, get_model,
+                           github_headers, read_head, validate_environment)
+
+# Conditional-request cache for GitHub REST responses (ETag + body per URL)
+GITHUB_CACHE_DIR = os.path.join('.cache', 'github')
+
+# Diff chars sent to the model by default (after compaction). Only this head of
+# the diff reaches the prompt, so never download more than MAX_DIFF_BYTES of it
+MAX_DIFF_CHARS = 6000
+MAX_DIFF_BYTES = 64 * 1024
+
+# Changes to these files alone aren't worth a review, nor is a near-empty diff
+NON_REVIEWABLE_RE = re.compile(
+    r'(package-lock\.json|yarn\.lock|pnpm-lock\.yaml|\.(svg|png|jpe?g|gif|ico|webp|lock|map|db))$'
+)
+MIN_DIFF_CHARS = 50
+
+# GitHub Actions checks pull_request events out at refs/pull/<n>/merge (or /head)
+CHECKED_OUT_PR_RE = re.compile(r'^refs/pull/(\d+)/')
+
+# Most important config files for Next.js projects, included as review context
+KEY_FILES = ['package.json', 'tsconfig.json', 'next.config.js', 'next.config.mjs']
+
+# Static review instructions. Every run sends this identical prefix first, with
+# the per-PR context and diff appended after it.
+STATIC_HEADER = """
+    Review this Next.js/React PR. Focus on critical issues only.
+
+    **Core Review Areas:**
+    - Critical bugs & security issues
+    - Performance problems
+    - React hooks & Next.js best practices
+    - TypeScript errors
+    - Code quality violations
+
+    Provide concise, actionable feedback focusing on the most important issues only.
+    """
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Review one or more PRs with Gemini and post the result as a comment")
+    parser.add_argument('api_key', help="Gemini API key")
+    parser.add_argument('pr_numbers', metavar='pr_number', type=int, nargs='+', help="PR number(s) to review")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help=f"Gemini model to use (default: {DEFAULT_MODEL})")
+    parser.add_argument('--max-diff-chars', type=int, default=MAX_DIFF_CHARS,
+                        help=f"Diff chars sent to the model (default: {MAX_DIFF_CHARS})")
+    parser.add_argument('--max-retries', type=int, default=gemini_retry.MAX_ATTEMPTS,
+                        help=f"Gemini attempts per review (default: {gemini_retry.MAX_ATTEMPTS})")
+    parser.add_argument('--checked-out-pr', type=int,
+                        help="PR whose tree is checked out here (default: the PR in GITHUB_REF, or the only "
+                             "PR given). Local context (recent commits, config and related files) is read "
+                             "from the checkout, so only this PR gets it; other PRs are reviewed from their "
+                             "diff alone")
+    return parser.parse_args(argv)
+
+def checked_out_pr(args):
+    """The PR whose tree the local checkout holds, or None if unknown"""
+    if args.checked_out_pr is not None:
+        return args.checked_out_pr
+    match = CHECKED_OUT_PR_RE.match(os.environ.get('GITHUB_REF', ''))
+    if match:
+        return int(match.group(1))
+    return args.pr_numbers[0] if len(args.pr_numbers) == 1 else None
 
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: python gemini_review.py <api_key> <pr_number>")
-        sys.exit(1)
+    args = parse_args()
+    validate_environment(args.api_key)
 
-    api_key = sys.argv[1]
-    pr_number = sys.argv[2]
+    review = functools.partial(review_pr, api_key=args.api_key, model_name=args.model,
+                               max_diff_chars=args.max_diff_chars, max_attempts=args.max_retries,
+                               checked_out_pr=checked_out_pr(args))
+    if len(args.pr_numbers) == 1:
+        review(args.pr_numbers[0])
+        return
 
-    if not api_key or api_key == "":
-        print("Error: GEMINI_API_KEY is required")
-        sys.exit(1)
+    # Review several PRs in one run so interpreter and SDK startup are paid once
+    # per worker rather than once per PR. Each worker builds its own Gemini
+    # client on first use, since grpc channels can't be shared across a fork.
+    workers = min(len(args.pr_numbers), os.cpu_count() or 1)
+    with Pool(workers) as pool:
+        pool.map(review, args.pr_numbers)
 
-    # Configure Gemini
-    try:
-        genai.configure(api_key=api_key)
-        # Use Gemini 2.5 Flash for better free tier limits (10 RPM vs 5 RPM for Pro)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-    except Exception as e:
-        print(f"Error configuring Gemini: {e}")
-        sys.exit(1)
-
-    # Get repo info from env
-    repo = os.environ.get('GITHUB_REPOSITORY', 'jehanzaib084/nextjs-payload-pipeline-v1')
-    github_token = os.environ.get('GITHUB_TOKEN', '')
-    
-    if not github_token:
-        print("Error: GITHUB_TOKEN is required")
-        sys.exit(1)
-    
-    try:
-        owner, repo_name = repo.split('/')
-    except ValueError:
-        print(f"Error: Invalid repository format: {repo}")
-        sys.exit(1)
-
-    # Get PR diff
-    diff_url = f"https://api.github.com/repos/{owner}/{repo_name}/pulls/{pr_number}"
-    headers = {'Authorization': f'token {github_token}', 'Accept': 'application/vnd.github.v3+json'}
-    
-    try:
-        pr_response = requests.get(diff_url, headers=headers, timeout=30)
-        if pr_response.status_code != 200:
-            print(f"Failed to fetch PR: {pr_response.status_code} - {pr_response.text}")
-            return
-        pr_data = pr_response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching PR data: {e}")
+def review_pr(pr_number, api_key, model_name=DEFAULT_MODEL, max_diff_chars=MAX_DIFF_CHARS,
+              max_attempts=gemini_retry.MAX_ATTEMPTS, checked_out_pr=None):
+    """Review a single PR and post the result as a comment. Local context is only
+    gathered when pr_number is the checked-out PR"""
+    print(f"Reviewing PR #{pr_number}...")
+    local_context = pr_number == checked_out_pr
+
+    # Fetch the diff and changed files while the git subprocess and local file
+    # reads for the extra context run alongside, so the wait is the slowest call
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        diff_future = executor.submit(fetch_pr_diff, pr_number)
+        files_future = executor.submit(get_changed_files, pr_number)
+        if local_context:
+            commits_future = executor.submit(get_recent_commits)
+            # The repo scan only needs the changed files list, not the diff
+            context_future = executor.submit(lambda: scan_repo_context(files_future.result()))
+
+    diff = diff_future.result()
+    if diff is None:
         return
-    except json.JSONDecodeError as e:
-        print(f"Error parsing PR data: {e}")
+    # Only changed lines matter for the review; unchanged context just costs tokens
+    diff = _compact_diff(diff)
+
+    # Don't spend a Gemini call on PRs that only touch lockfiles or assets
+    changed_files = files_future.result()
+    reviewable_files = [f for f in changed_files if not NON_REVIEWABLE_RE.search(f)]
+    if (changed_files and not reviewable_files) or len(diff.strip()) < MIN_DIFF_CHARS:
+        print(f"Nothing to review in PR #{pr_number} (empty diff or only lockfile/asset changes)")
         return
 
-    # Get diff content
-    try:
-        diff_url_content = pr_data.get('diff_url')
-        if not diff_url_content:
-            print("No diff URL found in PR data")
-            return
-            
-        diff_response = requests.get(diff_url_content, headers=headers, timeout=30)
-        if diff_response.status_code != 200:
-            print(f"Failed to fetch diff: {diff_response.status_code}")
+    if local_context:
+        # Additional context: recent commits, key files and related files
+        repo_context = context_future.result()
+        versions = repo_context.versions
+        context_section = build_context_section(commits_future.result(), repo_context)
+    else:
+        # The checkout holds another PR's tree, whose files and history would mislead
+        print(f"PR #{pr_number} is not checked out here; reviewing its diff without local context")
+        versions = None
+        context_section = "None available for this PR"
+
+    diff = diff[:max_diff_chars]
+    prompt = build_prompt(versions, context_section, diff)
+
+    # Reuse a recent review of the exact same prompt instead of calling Gemini again
+    cache_key = llm_cache.cache_key(model_name, prompt)
+    review = llm_cache.get_cached_response(cache_key)
+    if review:
+        print("Using cached review")
+    else:
+        try:
+            model = get_model(api_key, model_name)
+        except Exception as e:
+            print(f"Error configuring Gemini: {e}")
             return
-        diff = diff_response.text
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching diff: {e}")
+        review = generate_review(model, prompt, max_attempts)
+        if review:
+            llm_cache.cache_response(cache_key, review)
+    
+    if not review:
+        print("Failed to generate review after multiple attempts")
         return
 
-    # Get additional context: recent commits and key files
-    changed_files = get_changed_files(owner, repo_name, pr_number, headers)
-    recent_commits = get_recent_commits()
-    key_files_content = get_key_files_content()
-    related_files_content = get_related_files_content(changed_files)
-    next_version, react_version = get_project_versions()
+    # Post comment to PR
+    success = post_review_comment(pr_number, review)
+    if success:
+        print("✅ Review comment posted successfully")
+    else:
+        print("❌ Failed to post review comment")
 
-    # Optimize prompt size for free tier token limits
-    context_section = f"""
+def build_context_section(recent_commits, repo_context):
+    """Format the local context for the prompt (optimized for free tier token limits)"""
+    # Collect the fragments and join once instead of growing a string in a loop
+    context_parts = [f"""
     **Recent Commits (last 5):**
     {recent_commits[:1000]}  # Limit to 1k chars
 
     **Key Config Files:**
-    """
-    # Limit key files to most important ones
-    important_files = ['package.json', 'tsconfig.json', 'next.config.js', 'next.config.mjs']
-    for file in important_files:
-        if file in key_files_content:
-            content = key_files_content[file][:800]  # Limit each file to 800 chars
-            context_section += f"\n**{file}:**\n```\n{content}\n```\n"
+    """]
+    for file in KEY_FILES:
+        if file in repo_context.key_files:
+            content = repo_context.key_files[file][:800]  # Limit each file to 800 chars
+            context_parts.append(f"\n**{file}:**\n```\n{content}\n```\n")
 
     # Limit related files context
-    context_section += "\n**Related Files:**\n"
-    for file, content in list(related_files_content.items())[:2]:  # Only 2 files
-        context_section += f"\n**{file}:**\n```\n{content[:600]}\n```\n"  # 600 chars max
+    context_parts.append("\n**Related Files:**\n")
+    for file, content in list(repo_context.related_files.items())[:2]:  # Only 2 files
+        context_parts.append(f"\n**{file}:**\n```\n{content[:600]}\n```\n")  # 600 chars max
+    return "".join(context_parts)
 
-    # Prepare prompt for Gemini (optimized for free tier token limits)
-    prompt = f"""
-    Review this Next.js {next_version}/React {react_version} PR. Focus on critical issues only.
+def build_prompt(versions, context_section, diff):
+    """Build the review prompt (optimized for free tier token limits). versions is
+    (next_version, react_version), or None when they aren't known for this PR"""
+    project = "Next.js {}/React {}".format(*versions) if versions else "Next.js/React"
+    return STATIC_HEADER + f"""
+    **Project:** {project}
 
     **Context:**
     {context_section[:2000]}  # Limit context to 2k chars
 
-    **Core Review Areas:**
-    - Critical bugs & security issues
-    - Performance problems
-    - React hooks & Next.js best practices
-    - TypeScript errors
-    - Code quality violations
-
     **PR Changes:**
-    {diff[:6000]}  # Limit diff to 6k chars for free tier
-
-    Provide concise, actionable feedback focusing on the most important issues only.
+    {diff}
     """
 
-    # Generate review with improved retry logic for rate limits
-    max_retries = 5  # Increase retries for rate limits
-    review = None
-    base_delay = 5  # Start with 5 second delay
-    
-    for attempt in range(max_retries):
+def generate_review(model, prompt, max_attempts=gemini_retry.MAX_ATTEMPTS):
+    """Generate a review with improved retry logic for rate limits. Returns None on failure"""
+    for attempt in range(max_attempts):
         try:
             response = model.generate_content(prompt)
             if response and response.text:
-                review = response.text
-                break
-            else:
-                print(f"Empty response from Gemini (attempt {attempt + 1})")
-                if attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt)  # Exponential backoff
-                    print(f"Waiting {delay} seconds before retry...")
-                    time.sleep(delay)
+                return response.text
+            print(f"Empty response from Gemini (attempt {attempt + 1})")
+            delay = gemini_retry.backoff_delay(attempt)
         except Exception as e:
-            error_msg = str(e)
-            print(f"Error generating review (attempt {attempt + 1}): {error_msg}")
-            
-            # Handle rate limit errors specifically
-            if "429" in error_msg or "quota" in error_msg.lower():
-                if attempt < max_retries - 1:
-                    # Extract retry delay from error if available
-                    retry_delay = 60  # Default 60 seconds for rate limits
-                    if "retry_delay" in error_msg:
-                        try:
-                            import re
-                            delay_match = re.search(r'seconds: (\d+)', error_msg)
-                            if delay_match:
-                                retry_delay = int(delay_match.group(1)) + 5  # Add 5 sec buffer
-                        except:
-                            pass
-                    
-                    print(f"Rate limit hit. Waiting {retry_delay} seconds before retry...")
-                    time.sleep(retry_delay)
-                else:
-                    print("Rate limit exceeded. Consider using paid tier for higher limits.")
-                    return
-            else:
-                # Non-rate-limit errors: use exponential backoff
-                if attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt)
-                    print(f"Waiting {delay} seconds before retry...")
-                    time.sleep(delay)
-    
-    if not review:
-        print("Failed to generate review after multiple attempts")
-        return
+            print(f"Error generating review (attempt {attempt + 1}): {e}")
+            delay = gemini_retry.retry_delay(e, attempt)
+            if delay is None:
+                print("Error is not retryable, giving up")
+                return None
+            if gemini_retry.is_rate_limited(e):
+                print("Rate limit hit.")
 
-    # Post comment to PR
-    success = post_review_comment(owner, repo_name, pr_number, review, headers)
-    if success:
-        print("✅ Review comment posted successfully")
-    else:
-        print("❌ Failed to post review comment")
+        if attempt < max_attempts - 1:
+            print(f"Waiting {delay:.0f} seconds before retry...")
+            time.sleep(delay)
+    return None
+
+def _compact_diff(diff):
+    """Strip a unified diff down to file headers, hunk headers and changed lines"""
+    lines = []
+    in_header = False  # Between a "diff --git" line and its file's first hunk
+    for line in diff.splitlines():
+        if line.startswith('diff --git'):
+            in_header = True
+            lines.append(line)
+        elif line.startswith('@@'):
+            in_header = False
+            lines.append(line)
+        elif in_header:
+            continue  # index/mode lines and the ---/+++ path lines
+        elif line.startswith(('+', '-')):
+            lines.append(line)  # Includes changed lines that begin with -- or ++
+    return '\n'.join(lines)
+
+def _conditional_get(url, headers, max_bytes=None):
+    """GET through an on-disk ETag cache. A 304 reply (free against the rate limit)
+    reuses the stored body. With max_bytes, only that much of a successful body is
+    downloaded. Returns (status_code, text), 200 for cache hits"""
+    key = hashlib.sha1(f"{headers.get('Accept')} {max_bytes} {url}".encode('utf-8')).hexdigest()
+    cache_path = os.path.join(GITHUB_CACHE_DIR, f"{key}.json")
+    cached = None
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        headers = {**headers, 'If-None-Match': cached['etag']}
+    except (IOError, OSError, json.JSONDecodeError, KeyError, TypeError):
+        cached = None
+
+    with SESSION.get(url, headers=headers, timeout=30, stream=True) as response:
+        if response.status_code == 304 and cached:
+            return 200, cached['body']
+        if response.status_code == 200 and max_bytes:
+            # Stop reading at the cap instead of buffering the whole body. iter_content
+            # keeps requests' decoding and its wrapping of read errors
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=8192):
+                body += chunk
+                if len(body) >= max_bytes:
+                    break
+            text = bytes(body[:max_bytes]).decode('utf-8', 'ignore')
+        else:
+            text = response.text
+        status_code = response.status_code
+        etag = response.headers.get('ETag')
+
+    if status_code == 200 and etag:
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(GITHUB_CACHE_DIR, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'etag': etag, 'body': text}, f)
+            os.replace(tmp_path, cache_path)
+        except (IOError, OSError) as e:
+            print(f"Warning: Could not cache response for {url}: {e}")
+    return status_code, text
 
-def get_changed_files(owner, repo_name, pr_number, headers):
-    """Get list of changed files in the PR"""
-    files_url = f"https://api.github.com/repos/{owner}/{repo_name}/pulls/{pr_number}/files"
+def fetch_pr_diff(pr_number):
+    """Fetch the PR diff in one request using the diff media type. Returns None on failure"""
+    diff_headers = {**github_headers(), 'Accept': 'application/vnd.github.v3.diff'}
     try:
-        files_response = requests.get(files_url, headers=headers, timeout=30)
-        if files_response.status_code != 200:
-            print(f"Failed to fetch files: {files_response.status_code}")
-            return []
-        files_data = files_response.json()
-        return [f['filename'] for f in files_data if f.get('filename')]
+        status_code, diff = _conditional_get(f"{API_BASE}/pulls/{pr_number}", diff_headers,
+                                             max_bytes=MAX_DIFF_BYTES)
+        if status_code != 200:
+            print(f"Failed to fetch diff: {status_code} - {diff}")
+            return None
+        return diff
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching files: {e}")
-        return []
-    except json.JSONDecodeError as e:
-        print(f"Error parsing files data: {e}")
-        return []
+        print(f"Error fetching diff: {e}")
+        return None
 
 def get_recent_commits():
     """Get recent commit history (limited for token optimization)"""
@@ -205,83 +305,126 @@ def get_recent_commits():
     except (subprocess.TimeoutExpired, subprocess.CalledProcessError, Exception):
         return "Unable to fetch recent commits."
 
-def get_key_files_content():
-    """Get content of key configuration files (optimized for token limits)"""
-    key_files_content = {}
-    # Prioritize most important config files for Next.js projects
-    key_files = ['package.json', 'tsconfig.json', 'next.config.js', 'next.config.mjs']
-    
-    for file in key_files:
-        try:
-            if os.path.exists(file):
-                with open(file, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()[:1000]  # Reduced to 1k chars per file
-                    key_files_content[file] = content
-        except (IOError, OSError, UnicodeDecodeError) as e:
-            key_files_content[file] = f"File exists but unreadable: {e}"
-    
-    return key_files_content
+@dataclass
+class RepoContext:
+    """Local files gathered as review context"""
+    versions: tuple  # (next_version, react_version)
+    key_files: dict  # path -> content, or an "unreadable" note
+    related_files: dict  # path -> content
 
-def get_related_files_content(changed_files):
-    """Get content of files related to changed files (optimized for token limits)"""
-    related_files_content = {}
-    
+def scan_repo_context(changed_files):
+    """Gather the local review context in one pass: project versions, key config
+    files and files related to the changed ones (optimized for token limits).
+    package.json is read once and serves both the versions and its excerpt"""
+    key_files = {}
+    package_data = None
+    try:
+        package_text, package_data = _read_package_json(os.stat('package.json').st_mtime_ns)
+        key_files['package.json'] = read_head(io.StringIO(package_text), 1000)
+    except FileNotFoundError:
+        pass
+    except (IOError, OSError) as e:
+        key_files['package.json'] = f"File exists but unreadable: {e}"
+
+    # Remaining key files (1k chars each) and related files (800 chars each)
+    # are all read by the same pool
+    related_paths = _related_paths(changed_files)
+    reads = [(f, 1000) for f in KEY_FILES if f != 'package.json'] + [(f, 800) for f in related_paths]
+    related_files = {}
+    with ThreadPoolExecutor(max_workers=min(8, len(reads))) as executor:
+        for path, content, error in executor.map(lambda read: _read_file(*read), reads):
+            if path in related_paths:
+                if content is not None and not error:
+                    related_files[path] = content
+            elif error:
+                key_files[path] = f"File exists but unreadable: {error}"
+            elif content is not None:
+                key_files[path] = content
+
+    return RepoContext(project_versions(package_data), key_files, related_files)
+
+def _related_paths(changed_files):
+    """Pick files related to the changed files from their directories"""
     # Simple heuristic: include files in same directories or similar types
-    for changed_file in changed_files[:2]:  # Reduced to 2 changed files
-        try:
-            dir_path = os.path.dirname(changed_file)
-            if dir_path and os.path.exists(dir_path):
-                files_in_dir = os.listdir(dir_path)
-                related = [f for f in files_in_dir if f.endswith(('.ts', '.tsx', '.js', '.jsx'))][:2]  # Only 2 related files
-                
-                for rel_file in related:
-                    rel_path = os.path.join(dir_path, rel_file)
-                    if (rel_path not in related_files_content and 
-                        rel_path != changed_file and 
-                        os.path.exists(rel_path)):
-                        try:
-                            with open(rel_path, 'r', encoding='utf-8', errors='ignore') as f:
-                                related_files_content[rel_path] = f.read()[:800]  # Reduced to 800 chars
-                        except (IOError, OSError, UnicodeDecodeError):
-                            pass
-        except (OSError, Exception):
+    checked_files = changed_files[:2]  # Reduced to 2 changed files
+    related_paths = []
+    for dir_path in dict.fromkeys(os.path.dirname(f) for f in checked_files):  # Each directory once
+        if not dir_path:
             continue
-    
-    return related_files_content
+        # Scan past 2 by the number of changed files, which may be among the matches
+        candidates = [os.path.join(dir_path, f) for f in _source_files(dir_path, 2 + len(checked_files))]
+        related_paths.extend([p for p in candidates if p not in checked_files][:2])  # Only 2 related files
+    return related_paths
 
-def get_project_versions():
-    """Extract Next.js and React versions from package.json"""
+@functools.lru_cache(maxsize=None)
+def _source_files(dir_path, limit):
+    """List up to `limit` JS/TS source files in a directory, scanned at most once per
+    directory. Stops at the limit rather than reading the whole directory"""
+    names = []
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.name.endswith(('.ts', '.tsx', '.js', '.jsx')) and entry.is_file():
+                    names.append(entry.name)
+                    if len(names) == limit:
+                        break
+    except OSError:
+        pass
+    return names
+
+def _read_file(path, limit):
+    """Read the first `limit` chars of a file, returning (path, content, error)"""
+    try:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            return path, read_head(f, limit), None
+    except FileNotFoundError:
+        pass
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        return path, None, e
+    return path, None, None
+
+def project_versions(package_data):
+    """Extract Next.js and React versions from parsed package.json data"""
     next_version = "15.x"  # Default
     react_version = "19.x"  # Default
     
-    try:
-        if os.path.exists('package.json'):
-            with open('package.json', 'r', encoding='utf-8') as f:
-                package_data = json.load(f)
-                
-                # Check dependencies and devDependencies
-                deps = {**package_data.get('dependencies', {}), 
-                       **package_data.get('devDependencies', {})}
-                
-                if 'next' in deps:
-                    next_version = deps['next'].replace('^', '').replace('~', '')
-                if 'react' in deps:
-                    react_version = deps['react'].replace('^', '').replace('~', '')
-                    
-    except (IOError, OSError, json.JSONDecodeError, Exception):
-        pass
+    if not isinstance(package_data, dict):
+        return next_version, react_version  # No package.json, or invalid JSON
+    
+    # Check dependencies and devDependencies
+    deps = {}
+    for section in ('dependencies', 'devDependencies'):
+        if isinstance(package_data.get(section), dict):
+            deps.update(package_data[section])
+    
+    if isinstance(deps.get('next'), str):
+        next_version = deps['next'].replace('^', '').replace('~', '')
+    if isinstance(deps.get('react'), str):
+        react_version = deps['react'].replace('^', '').replace('~', '')
     
     return next_version, react_version
 
-def post_review_comment(owner, repo_name, pr_number, review, headers):
+@functools.lru_cache(maxsize=4)
+def _read_package_json(mtime_ns):
+    """Read and parse package.json once per modification time, so workers reviewing
+    several PRs don't re-read it. Returns (text, data), with data None if the file
+    isn't valid JSON. Callers must not mutate data"""
+    with open('package.json', 'r', encoding='utf-8', errors='ignore') as f:
+        text = f.read()
+    try:
+        return text, json.loads(text)
+    except json.JSONDecodeError:
+        return text, None
+
+def post_review_comment(pr_number, review):
     """Post the review comment to the PR"""
-    comment_url = f"https://api.github.com/repos/{owner}/{repo_name}/issues/{pr_number}/comments"
+    comment_url = f"{API_BASE}/issues/{pr_number}/comments"
     comment_data = {
         "body": f"🤖 **Gemini AI Code Review**\n\n{review}"
     }
     
     try:
-        comment_response = requests.post(comment_url, json=comment_data, headers=headers, timeout=30)
+        comment_response = SESSION.post(comment_url, json=comment_data, headers=github_headers(), timeout=30)
         return comment_response.status_code == 201
     except requests.exceptions.RequestException as e:
         print(f"Error posting comment: {e}")
@@ -0,0 +1,51 @@
+"""File-backed cache for Gemini responses, shared by the review and fix scripts"""
+import hashlib
+import json
+import os
+import time
+
+CACHE_DIR = os.path.join('.cache', 'gemini')
+CACHE_TTL = 24 * 60 * 60  # Cached responses expire after a day
+
+# Generation settings the scripts run Gemini with. Temperature 0 makes responses
+# deterministic, which is what makes returning a stored response sound
+GENERATION_CONFIG = {'temperature': 0}
+
+def cache_key(model_name, content, generation_config=GENERATION_CONFIG):
+    """Build a stable cache key from the model, generation settings and prompt.
+    Returns None (caching disabled) when sampling isn't deterministic"""
+    if generation_config.get('temperature') != 0:
+        return None
+    payload = json.dumps({'model': model_name, 'config': generation_config, 'content': content}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _cache_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+def get_cached_response(key, ttl=CACHE_TTL):
+    """Return the cached response for key, or None if missing or expired"""
+    if key is None:
+        return None
+    try:
+        with open(_cache_path(key), 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (IOError, OSError, json.JSONDecodeError):
+        return None
+
+    if time.time() - entry.get('created_at', 0) > ttl:
+        return None
+    return entry.get('response')
+
+def cache_response(key, response):
+    """Store a response for key. Cache write failures are never fatal"""
+    if key is None:
+        return
+    path = _cache_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': time.time(), 'response': response}, f)
+        os.replace(tmp_path, path)  # Atomic so concurrent readers never see partial entries
+    except (IOError, OSError) as e:
+        print(f"Warning: Could not write cache entry {key}: {e}")